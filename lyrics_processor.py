@@ -1,10 +1,16 @@
 import os
-import librosa
+import math
+import subprocess
+import numba
 import numpy as np
-from datetime import timedelta
+import numpy_rms
+import soundfile
+from mutagen.mp3 import MP3
+from scipy.signal import resample_poly
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import logging
-from typing import List, Tuple, Optional
+from typing import Iterator, List, Tuple, Optional
 import re
 
 # 设置日志
@@ -14,17 +20,49 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@numba.njit(cache=True)
+def _find_silence_runs(rms: np.ndarray, thresh_db: float,
+                       min_len: int) -> Tuple[np.ndarray, np.ndarray]:
+    """单次遍历RMS包络，找出长度不少于 min_len 帧的静音段，返回起止帧索引"""
+    # 在线性幅度域比较，等价于 20*log10(rms + 1e-10) < thresh_db，无需逐帧取对数
+    thresh = 10.0 ** (thresh_db / 20.0) - 1e-10
+    n = rms.size
+    starts = np.empty(n // 2 + 1, dtype=np.int64)
+    ends = np.empty(n // 2 + 1, dtype=np.int64)
+    count = 0
+    run_start = -1
+    for i in range(n):
+        if rms[i] < thresh:
+            if run_start < 0:
+                run_start = i
+        elif run_start >= 0:
+            if i - run_start >= min_len:
+                starts[count] = run_start
+                ends[count] = i
+                count += 1
+            run_start = -1
+    
+    # 音频以静音结尾
+    if run_start >= 0 and n - run_start >= min_len:
+        starts[count] = run_start
+        ends[count] = n
+        count += 1
+    
+    return starts[:count], ends[:count]
+
 class LyricsProcessor:
-    def __init__(self, base_dir: str = r"C:\Users\johntao\Desktop\mp3_lyrics"):
+    def __init__(self, base_dir: str = r"C:\Users\johntao\Desktop\mp3_lyrics",
+                 create_dirs: bool = True):
         self.base_dir = Path(base_dir)
         self.mp3_dir = self.base_dir / "mp3"
         self.lyrics_dir = self.base_dir / "lyrics"
         self.output_dir = self.base_dir / "output"
         
-        # 创建必要的目录
-        for directory in [self.mp3_dir, self.lyrics_dir, self.output_dir]:
-            directory.mkdir(parents=True, exist_ok=True)
-            logger.info(f"确保目录存在: {directory}")
+        # 创建必要的目录（进程池工作进程中由主进程保证目录已存在，无需重复创建）
+        if create_dirs:
+            for directory in [self.mp3_dir, self.lyrics_dir, self.output_dir]:
+                directory.mkdir(parents=True, exist_ok=True)
+                logger.info(f"确保目录存在: {directory}")
         
         # 定义需要清理的歌词标记模式
         self.lyrics_patterns = [
@@ -32,62 +70,70 @@ class LyricsProcessor:
             (r'\(.*?\)', ''),  # 移除 (x2)、(重复) 等括号内容
             (r'【.*?】', ''),  # 移除【】中的内容
             (r'（.*?）', ''),  # 移除（）中的内容
-            (r'[★☆♪♫♬♩♭♮♯]', ''),  # 移除音乐符号
             (r'[0-9]+\.', ''),  # 移除行号
             (r'^\s*[-—~]+\s*$', ''),  # 移除单独的分隔线
             (r'^\s*$', ''),  # 移除空行
         ]
         
+        # 需要移除的音乐符号，使用 str.translate 删除，比正则字符类更快
+        self.music_symbols = '★☆♪♫♬♩♭♮♯'
+        
         # 分隔符模式
         self.separator_pattern = r'[⸻—~]+'
         
         # 句子结束标记
         self.sentence_endings = r'[。！？，；：]'
+        
+        # 预编译正则表达式，避免每次处理时重复编译
+        # lyrics_patterns 均为删除型模式，按类别分三遍执行，每遍合并为一个交替正则：
+        # 删除括号标记后可能露出行号（如 "1(x2)."），二者删除后又可能留下分隔线或空行，
+        # 因此后一类模式必须匹配前一遍清理后的文本
+        line_number_pattern = r'[0-9]+\.'
+        bracket_deletes = [p for p, _ in self.lyrics_patterns
+                           if p != line_number_pattern and not p.startswith('^')]
+        line_deletes = [p for p, _ in self.lyrics_patterns if p.startswith('^')]
+        self._delete_passes = [
+            re.compile('|'.join(f'(?:{p})' for p in group), re.MULTILINE)
+            for group in (bracket_deletes, [line_number_pattern], line_deletes)
+        ]
+        self._symbol_table = str.maketrans('', '', self.music_symbols)
+        self._separator_re = re.compile(self.separator_pattern)
+        self._sentence_end_re = re.compile(self.sentence_endings)
+        self._ws_re = re.compile(r'\s+')
+        self._line_re = re.compile(r'[^\s\n][^\n]*')
+        # 句子切分：闭合的引号内容与前文整体保留，其余按句末标点断开；
+        # 」 也可闭合以 " 开始的引号；未闭合的引号从引号处单独成段并延续到行尾
+        self._tokenize_re = re.compile(
+            r'「[^」]*$|"[^"」]*$|(?:「[^」]*」|"[^"」]*[」"]|[^。！？，；：「"])+'
+        )
+        
+        # 静音检测只依赖能量包络，降采样到 8kHz 分析即可，可大幅减少计算量和内存
+        self.analysis_sr = 8000
+        
+        # 歌词行数不超过该值时跳过静音检测，直接均匀分配时间戳；
+        # 行数很少时两种方式结果相近，却可省去解码音频这一最耗时的步骤
+        self.min_lines_for_alignment = 4
 
     def split_lyrics_into_lines(self, text: str) -> List[str]:
         """将歌词文本分割成独立的行"""
         # 首先清理文本
-        cleaned_text = text
-        for pattern, replacement in self.lyrics_patterns:
-            cleaned_text = re.sub(pattern, replacement, cleaned_text, flags=re.MULTILINE)
+        cleaned_text = text.translate(self._symbol_table)
+        for pattern in self._delete_passes:
+            cleaned_text = pattern.sub('', cleaned_text)
         
-        # 按换行符分割
-        lines = [line.strip() for line in cleaned_text.split('\n') if line.strip()]
+        # 按换行符分割：正则只匹配以非空白字符开头的行，空行在C层即被跳过
+        lines = [line.rstrip() for line in self._line_re.findall(cleaned_text)]
         
         # 处理每一行
         processed_lines = []
         for line in lines:
             # 如果行中包含标点符号，按标点符号分割
-            if re.search(self.sentence_endings, line):
+            if self._sentence_end_re.search(line):
                 # 分割句子但保持引号内的内容完整
-                current = ""
-                in_quotes = False
-                quote_buffer = ""
-                
-                for char in line:
-                    if char in '「"':
-                        in_quotes = True
-                        quote_buffer += char
-                    elif char in '」"':
-                        in_quotes = False
-                        quote_buffer += char
-                        current += quote_buffer
-                        quote_buffer = ""
-                    elif in_quotes:
-                        quote_buffer += char
-                    else:
-                        if char in '。！？，；：':
-                            if current.strip():
-                                processed_lines.append(current.strip())
-                            current = ""
-                        else:
-                            current += char
-                
-                # 添加最后一个部分
-                if current.strip():
-                    processed_lines.append(current.strip())
-                if quote_buffer.strip():
-                    processed_lines.append(quote_buffer.strip())
+                for segment in self._tokenize_re.findall(line):
+                    segment = segment.strip()
+                    if segment:
+                        processed_lines.append(segment)
             else:
                 # 如果没有标点符号，整行作为一个句子
                 processed_lines.append(line)
@@ -96,7 +142,7 @@ class LyricsProcessor:
         cleaned_lines = []
         for line in processed_lines:
             # 移除多余的空格
-            line = re.sub(r'\s+', ' ', line)
+            line = self._ws_re.sub(' ', line)
             # 移除首尾空格
             line = line.strip()
             if line:
@@ -104,84 +150,141 @@ class LyricsProcessor:
         
         return cleaned_lines
 
+    def format_times(self, timestamps: np.ndarray) -> List[str]:
+        """将一组秒数批量转换为LRC时间格式 [mm:ss.xx]"""
+        ts = np.asarray(timestamps, dtype=np.float64)
+        mm = (ts // 60).astype(int)
+        ss = (ts % 60).astype(int)
+        cs = ((ts - np.floor(ts)) * 100).astype(int)
+        return [f"[{m:02d}:{s:02d}.{c:02d}]"
+                for m, s, c in zip(mm.tolist(), ss.tolist(), cs.tolist())]
+
     def format_time(self, seconds: float) -> str:
         """将秒数转换为LRC时间格式 [mm:ss.xx]"""
-        td = timedelta(seconds=seconds)
-        mm, ss = divmod(td.seconds, 60)
-        ms = int((seconds - int(seconds)) * 100)
-        return f"[{mm:02d}:{ss:02d}.{ms:02d}]"
+        return self.format_times(np.array([seconds]))[0]
+
+    def _is_mp3(self, audio_path: str) -> bool:
+        """根据扩展名判断是否为MP3文件"""
+        return Path(audio_path).suffix.lower() == '.mp3'
+
+    def _get_duration(self, audio_path: str) -> float:
+        """只读取文件头获取音频时长，不解码音频"""
+        if self._is_mp3(audio_path):
+            return MP3(audio_path).info.length
+        return soundfile.info(audio_path).duration
+
+    def _iter_audio_blocks(self, audio_path: str, sr: int,
+                           block_size: int = 2 ** 20) -> Iterator[np.ndarray]:
+        """流式解码音频，逐块产出指定采样率的单声道 float32 采样"""
+        # MP3 交给 ffmpeg 解码最快，WAV/FLAC/OGG 等格式直接由 libsndfile 读取
+        if self._is_mp3(audio_path):
+            return self._iter_ffmpeg_blocks(audio_path, sr, block_size)
+        return self._iter_soundfile_blocks(audio_path, sr, block_size)
+
+    def _iter_soundfile_blocks(self, audio_path: str, sr: int,
+                               block_size: int) -> Iterator[np.ndarray]:
+        """通过 soundfile 流式读取音频，混为单声道后逐块重采样"""
+        native_sr = soundfile.info(audio_path).samplerate
+        g = math.gcd(sr, native_sr)
+        up, down = sr // g, native_sr // g
+        # 块长取 down 的整数倍，使每块重采样后的长度精确对齐
+        block_size = max(down, block_size - block_size % down)
+        for block in soundfile.blocks(audio_path, blocksize=block_size,
+                                      dtype='float32', always_2d=True):
+            mono = block.mean(axis=1)
+            if up != down:
+                # 逐块重采样在块边界处会有轻微失真，对能量包络的影响可以忽略
+                mono = resample_poly(mono, up, down)
+            yield mono.astype(np.float32, copy=False)
+
+    def _iter_ffmpeg_blocks(self, audio_path: str, sr: int,
+                            block_size: int) -> Iterator[np.ndarray]:
+        """通过 ffmpeg 管道流式解码音频，逐块产出单声道 float32 采样"""
+        cmd = ['ffmpeg', '-nostdin', '-v', 'quiet', '-i', audio_path,
+               '-f', 'f32le', '-ac', '1', '-ar', str(sr), 'pipe:1']
+        # 不继承终端的标准输入，避免多个并行的 ffmpeg 进程抢占按键输入
+        with subprocess.Popen(cmd, stdin=subprocess.DEVNULL,
+                              stdout=subprocess.PIPE) as proc:
+            while True:
+                raw = proc.stdout.read(block_size * 4)
+                if not raw:
+                    break
+                yield np.frombuffer(raw, dtype=np.float32)
+        if proc.returncode:
+            raise RuntimeError(f"ffmpeg 解码失败: {audio_path}")
+
+    def _compute_rms(self, audio_path: str, sr: int,
+                     frame_length: int) -> Tuple[np.ndarray, int]:
+        """流式计算音频的RMS能量包络，内存占用与音频长度无关，同时返回解码的采样总数"""
+        chunks = []
+        n_samples = 0
+        # 块间保留不足一帧的尾部采样，保证帧边界对齐
+        tail = np.empty(0, dtype=np.float32)
+        for block in self._iter_audio_blocks(audio_path, sr):
+            n_samples += block.size
+            buf = np.concatenate((tail, block)) if tail.size else block
+            usable = buf.size - buf.size % frame_length
+            if usable:
+                # numpy_rms 的 SIMD 实现要求连续的 float32 输入
+                frames = np.ascontiguousarray(buf[:usable], dtype=np.float32)
+                chunks.append(numpy_rms.rms(frames, window_size=frame_length))
+            tail = buf[usable:]
+        
+        # 最后不足一帧的采样单独计算
+        if tail.size:
+            chunks.append(np.sqrt(np.mean(np.square(tail), keepdims=True)))
+        
+        if not chunks:
+            return np.empty(0, dtype=np.float32), n_samples
+        return np.concatenate(chunks), n_samples
 
     def detect_silence(self, audio_path: str, min_silence_len: int = 1000, 
-                      silence_thresh: float = -40) -> List[Tuple[float, float]]:
-        """检测音频中的静音段"""
+                      silence_thresh: float = -40) -> Tuple[np.ndarray, np.ndarray, float]:
+        """检测音频中的静音段，返回各静音段起止时间（秒）的数组及音频时长，min_silence_len 单位为毫秒"""
         try:
-            # 加载音频文件
-            y, sr = librosa.load(audio_path, sr=None)
-            
-            # 计算音频的RMS能量
-            rms = librosa.feature.rms(y=y)[0]
+            # 降采样后流式解码，逐帧计算音频的RMS能量
+            # 8kHz 下 128 个采样一帧（16ms），与原始采样率下 512 采样的帧长相当
+            sr = self.analysis_sr
+            hop_length = 128
+            rms, n_samples = self._compute_rms(audio_path, sr, hop_length)
             
-            # 将能量转换为dB
-            db = 20 * np.log10(rms + 1e-10)
+            # 阈值比较与静音段提取在一次编译后的遍历中完成，最短静音长度从毫秒换算为帧数
+            min_frames = int(np.ceil(min_silence_len / 1000 * sr / hop_length))
+            starts, ends = _find_silence_runs(rms, float(silence_thresh), min_frames)
             
-            # 找出静音段
-            silence_mask = db < silence_thresh
-            silence_regions = []
-            
-            start = None
-            for i, is_silence in enumerate(silence_mask):
-                if is_silence and start is None:
-                    start = i
-                elif not is_silence and start is not None:
-                    if i - start >= min_silence_len:
-                        silence_regions.append((start / sr, i / sr))
-                    start = None
-            
-            return silence_regions
+            # 帧索引换算为秒
+            frame_duration = hop_length / sr
+            return starts * frame_duration, ends * frame_duration, n_samples / sr
         except Exception as e:
             logger.error(f"处理音频文件时出错: {str(e)}")
-            return []
+            return np.empty(0), np.empty(0), 0.0
 
     def calculate_timestamps(self, lines: List[str], duration: float, 
-                           silence_regions: List[Tuple[float, float]]) -> List[float]:
+                           silence_starts: np.ndarray) -> List[float]:
         """计算每行歌词的时间戳"""
-        if not silence_regions:
+        n = len(lines)
+        m = silence_starts.size
+        if m == 0:
             # 如果没有检测到静音段，使用均匀分布
-            interval = duration / (len(lines) + 1)
-            return [interval * (i + 1) for i in range(len(lines))]
-        
-        # 使用静音段来分配时间戳
-        timestamps = []
-        silence_times = [start for start, _ in silence_regions]
+            interval = duration / (n + 1)
+            return (np.arange(1, n + 1) * interval).tolist()
         
         # 如果歌词行数少于静音段数，使用前N个静音段
-        if len(lines) <= len(silence_times):
-            return silence_times[:len(lines)]
+        if n <= m:
+            return silence_starts[:n].tolist()
         
-        # 如果歌词行数多于静音段数，需要补充时间戳
-        remaining_lines = len(lines) - len(silence_times)
-        if remaining_lines > 0:
-            # 计算每个静音段之间的平均间隔
-            intervals = []
-            for i in range(len(silence_times) - 1):
-                intervals.append(silence_times[i + 1] - silence_times[i])
-            avg_interval = sum(intervals) / len(intervals) if intervals else 2.0
-            
-            # 使用平均间隔补充时间戳
-            timestamps = silence_times.copy()
-            last_time = silence_times[-1]
-            for _ in range(remaining_lines):
-                last_time += avg_interval
-                timestamps.append(last_time)
-            
-            # 确保最后一个时间戳不超过音频时长
-            if timestamps[-1] > duration:
-                # 重新调整时间戳
-                total_time = timestamps[-1] - timestamps[0]
-                scale_factor = (duration - timestamps[0]) / total_time
-                timestamps = [timestamps[0] + (t - timestamps[0]) * scale_factor for t in timestamps]
+        # 如果歌词行数多于静音段数，按静音段之间的平均间隔补充时间戳
+        avg_interval = np.mean(np.diff(silence_starts)) if m > 1 else 2.0
+        extra = silence_starts[-1] + np.arange(1, n - m + 1) * avg_interval
+        timestamps = np.concatenate((silence_starts, extra))
+        
+        # 确保最后一个时间戳不超过音频时长
+        if timestamps[-1] > duration:
+            # 重新调整时间戳
+            first = timestamps[0]
+            timestamps = first + (timestamps - first) * (duration - first) / (timestamps[-1] - first)
         
-        return timestamps
+        return timestamps.tolist()
 
     def process_lyrics(self, audio_path: str, lyrics_path: str, 
                       output_path: Optional[str] = None) -> bool:
@@ -193,32 +296,37 @@ class LyricsProcessor:
                 return False
 
             # 读取并处理歌词
-            with open(lyrics_path, 'r', encoding='utf-8') as f:
-                raw_lyrics = f.read()
-                lines = self.split_lyrics_into_lines(raw_lyrics)
+            raw_lyrics = Path(lyrics_path).read_text(encoding='utf-8')
+            lines = self.split_lyrics_into_lines(raw_lyrics)
 
             if not lines:
                 logger.error(f"处理后的歌词为空: {lyrics_path}")
                 return False
 
-            # 获取音频时长
-            duration = librosa.get_duration(path=audio_path)
+            # 检测静音段（歌词行数较少时跳过），音频时长取自同一次解码
+            if len(lines) <= self.min_lines_for_alignment:
+                silence_starts, duration = np.empty(0), 0.0
+            else:
+                silence_starts, _, duration = self.detect_silence(audio_path)
             
-            # 检测静音段
-            silence_regions = self.detect_silence(audio_path)
+            # 未解码音频或解码失败时，从文件头读取时长
+            if not duration:
+                duration = self._get_duration(audio_path)
             
             # 计算时间戳
-            timestamps = self.calculate_timestamps(lines, duration, silence_regions)
+            timestamps = self.calculate_timestamps(lines, duration, silence_starts)
 
             # 生成输出路径
             if output_path is None:
                 output_filename = Path(lyrics_path).stem + '.lrc'
                 output_path = str(self.output_dir / output_filename)
 
-            # 写入LRC文件
-            with open(output_path, 'w', encoding='utf-8') as out:
-                for timestamp, line in zip(timestamps, lines):
-                    out.write(f"{self.format_time(timestamp)} {line}\n")
+            # 一次性写入LRC文件
+            lrc_text = '\n'.join(
+                f"{time_tag} {line}"
+                for time_tag, line in zip(self.format_times(timestamps), lines)
+            )
+            Path(output_path).write_text(lrc_text + '\n', encoding='utf-8')
 
             logger.info(f"成功生成LRC文件: {output_path}")
             return True
@@ -236,20 +344,48 @@ class LyricsProcessor:
             logger.warning(f"在 {self.mp3_dir} 目录中没有找到MP3文件")
             return
         
-        # 处理每个MP3文件
+        # 一次扫描歌词目录建立索引，避免对每个MP3单独检查文件是否存在
+        lyrics_index = {os.path.normcase(p.stem): p for p in self.lyrics_dir.glob("*.txt")}
+        
+        # 收集需要处理的音频/歌词文件对
+        pairs = []
         for mp3_file in mp3_files:
-            # 获取对应的歌词文件
-            lyrics_file = self.lyrics_dir / f"{mp3_file.stem}.txt"
+            # 获取对应的歌词文件；索引未命中时交给文件系统判断，
+            # 以便在不区分大小写的文件系统（如 macOS 默认卷）上仍能匹配
+            lyrics_file = lyrics_index.get(os.path.normcase(mp3_file.stem))
+            if lyrics_file is None:
+                lyrics_file = self.lyrics_dir / f"{mp3_file.stem}.txt"
+                if not lyrics_file.exists():
+                    logger.warning(f"未找到对应的歌词文件: {lyrics_file.name}")
+                    continue
             
-            if not lyrics_file.exists():
-                logger.warning(f"未找到对应的歌词文件: {lyrics_file.name}")
-                continue
-            
-            logger.info(f"正在处理: {mp3_file.name}")
-            if self.process_lyrics(str(mp3_file), str(lyrics_file)):
-                logger.info(f"成功处理: {mp3_file.name}")
-            else:
-                logger.error(f"处理失败: {mp3_file.name}")
+            pairs.append((str(mp3_file), str(lyrics_file)))
+        
+        if not pairs:
+            return
+        
+        # 各文件的处理相互独立，使用进程池并行处理
+        with ProcessPoolExecutor(initializer=_init_worker,
+                                 initargs=(str(self.base_dir),)) as executor:
+            for mp3_path, success in executor.map(_process_file_pair, pairs):
+                if success:
+                    logger.info(f"成功处理: {Path(mp3_path).name}")
+                else:
+                    logger.error(f"处理失败: {Path(mp3_path).name}")
+
+# 进程池中每个工作进程持有一个处理器实例
+_worker_processor: Optional[LyricsProcessor] = None
+
+def _init_worker(base_dir: str) -> None:
+    """进程池初始化函数：在工作进程中创建处理器"""
+    global _worker_processor
+    _worker_processor = LyricsProcessor(base_dir, create_dirs=False)
+
+def _process_file_pair(pair: Tuple[str, str]) -> Tuple[str, bool]:
+    """进程池工作函数：处理一对音频和歌词文件"""
+    audio_path, lyrics_path = pair
+    logger.info(f"正在处理: {Path(audio_path).name}")
+    return audio_path, _worker_processor.process_lyrics(audio_path, lyrics_path)
 
 def main():
     processor = LyricsProcessor()